@@ -4,8 +4,13 @@ Telegram Gift Management Bot
 """
 
 import os
+import re
+import asyncio
 import logging
+from collections import defaultdict
+from functools import lru_cache
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -15,25 +20,30 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-from database import Database, DATABASE_PATH
+from database import Database, DATABASE_PATH, check_database_file
 
 # Logging setup
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     level=logging.INFO
 )
+# httpx logs every Bot API request at INFO; keep only warnings and errors
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
+# Special MarkdownV2 characters, each mapped to its escaped form
+_MD_ESCAPE = str.maketrans({
+    char: f'\\{char}'
+    for char in ['\\', '_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+})
+
+
 def escape_md(text: str) -> str:
     """Escape Markdown special characters for MarkdownV2"""
     if not text:
         return ""
-    # Escape special MarkdownV2 characters (order matters for backslash)
-    special_chars = ['\\', '_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
+    return text.translate(_MD_ESCAPE)
 
 # Conversation states
 ADDING_GIFT_NAME, ADDING_GIFT_PRICE, ADDING_GIFT_CATEGORY = range(3)
@@ -64,44 +74,164 @@ CATEGORIES = {
     "experience": "🎭 Впечатления",
     "other": "📦 Другое"
 }
+# Display order of categories in the gift list
+_CATEGORY_ORDER = tuple(CATEGORIES)
 
 # Status emojis
 STATUS_EMOJI = {
     "available": "🟢",      # Свободен
     "claimed": "🟡",        # Один человек купит
     "shared": "👥",         # Несколько скидываются (не набрано)
+    "shared_many": "👥",    # Скидываются несколько человек
     "funded": "🔴",         # Сумма полностью набрана
     "bought": "✅",         # Уже куплен
     "already_has": "🚫"     # Уже есть у именинника
 }
 
+# Status descriptions for the gift card (MarkdownV2-escaped)
+STATUS_TEXT = {
+    "available": "Свободен",
+    "claimed": "Кто\\-то покупает",
+    "shared": "Ищут компанию для скидывания",
+    "shared_many": "Скидываются несколько человек",
+    "funded": "Сумма собрана\\!",
+    "bought": "Уже куплен",
+    "already_has": "Уже есть у именинника"
+}
+
 # Minimum contribution amount
 MIN_CONTRIBUTION = 1000  # Минимальный взнос 1000₽
 
 # Maximum number of contributors for shared purchases
 MAX_CONTRIBUTORS = 5  # Максимум 5 человек скидываются на один подарок
 
+# Max length of the facts text before it is cut (Telegram limit is 4096)
+FACTS_TEXT_LIMIT = 3800
+
+# Gifts per page in the list view
+PAGE_SIZE = 10
+LIST_PAGE_PREFIX = "list_gifts_p"
+
+# Users per page in the ban list (callback_data: ban_list_after_<user_id>)
+BAN_LIST_PAGE_SIZE = 20
+BAN_LIST_PAGE_PREFIX = "ban_list_after_"
+
+# Delay before re-rendering a gift card after a change (seconds)
+REFRESH_DEBOUNCE = 0.2
+
+# Broadcast pacing: messages per batch, pause between batches (seconds),
+# global cap on in-flight sends and retries after flood control
+BROADCAST_BATCH_SIZE = 25
+BROADCAST_INTERVAL = 1.0
+BROADCAST_CONCURRENCY = 30
+BROADCAST_MAX_RETRIES = 3
+
+# Static keyboards (built once at import)
+_MAIN_MENU_ROWS = [
+    [InlineKeyboardButton("📋 Список подарков", callback_data="list_gifts")],
+    [InlineKeyboardButton("➕ Добавить идею", callback_data="add_gift")],
+    [InlineKeyboardButton(f"💡 Узнать {BIRTHDAY_PERSON_ACC} лучше", callback_data="facts_menu")],
+    [InlineKeyboardButton("🎁 Мои подарки", callback_data="my_gifts")],
+    [InlineKeyboardButton("📊 Статистика", callback_data="stats")],
+]
+_MAIN_MENU_KB_USER = InlineKeyboardMarkup(_MAIN_MENU_ROWS)
+_MAIN_MENU_KB_ADMIN = InlineKeyboardMarkup(
+    _MAIN_MENU_ROWS + [[InlineKeyboardButton("⚙️ Админ-панель", callback_data="admin_panel")]]
+)
+_BACK_TO_MAIN_ROW = [InlineKeyboardButton("🔙 Назад", callback_data="main_menu")]
+_CATEGORY_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton(name, callback_data=f"category_{key}")]
+    for key, name in CATEGORIES.items()
+])
+_BACK_TO_MAIN_KB = InlineKeyboardMarkup([_BACK_TO_MAIN_ROW])
+_EMPTY_LIST_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Добавить первую идею", callback_data="add_gift")],
+    _BACK_TO_MAIN_ROW,
+])
+_FACTS_MENU_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"📖 Почитать о {BIRTHDAY_PERSON_PREP}", callback_data="read_facts")],
+    [InlineKeyboardButton(f"✏️ Рассказать о {BIRTHDAY_PERSON_PREP}", callback_data="add_fact")],
+    _BACK_TO_MAIN_ROW,
+])
+_NO_FACTS_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✏️ Рассказать первым!", callback_data="add_fact")],
+    [InlineKeyboardButton("🔙 Назад", callback_data="facts_menu")],
+])
+_READ_FACTS_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✏️ Добавить своё", callback_data="add_fact")],
+    [InlineKeyboardButton("🔙 Назад", callback_data="facts_menu")],
+])
+_FACT_SAVED_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✏️ Добавить ещё", callback_data="add_fact")],
+    [InlineKeyboardButton("📖 Почитать что пишут другие", callback_data="read_facts")],
+    [InlineKeyboardButton("🔙 В главное меню", callback_data="main_menu")],
+])
+_CANCEL_TO_MAIN_KB = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="main_menu")]])
+_CANCEL_TO_FACTS_KB = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="facts_menu")]])
+_SKIP_PRICE_KB = InlineKeyboardMarkup([[InlineKeyboardButton("Пропустить", callback_data="skip_price")]])
+_ADMIN_PANEL_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚫 Забанить именинника", callback_data="admin_ban")],
+    [InlineKeyboardButton("✅ Разбанить пользователя", callback_data="admin_unban")],
+    [InlineKeyboardButton("👑 Добавить админа", callback_data="admin_add")],
+    [InlineKeyboardButton("📋 Список забаненных", callback_data="admin_banned_list")],
+    _BACK_TO_MAIN_ROW,
+])
+_ADMIN_BAN_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 Выбрать из списка", callback_data="ban_from_list")],
+    [InlineKeyboardButton("✏️ Ввести ID вручную", callback_data="ban_manual")],
+    [InlineKeyboardButton("🔙 Назад", callback_data="admin_panel")],
+])
+_BACK_TO_ADMIN_KB = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="admin_panel")]])
+_BACK_TO_ADMIN_BAN_KB = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="admin_ban")]])
+_CANCEL_TO_ADMIN_BAN_KB = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="admin_ban")]])
+_BROADCAST_CONFIRM_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Отправить всем", callback_data="broadcast_confirm")],
+    [InlineKeyboardButton("❌ Отмена", callback_data="broadcast_cancel")],
+])
+
+# Static message texts
+_MAIN_MENU_TEXT = (
+    f"🎁 *Бот для сбора подарков* 🎁\n\n"
+    f"Здесь мы собираем идеи подарков для {BIRTHDAY_PERSON_GEN} и координируем покупки!\n\n"
+    f"📋 — посмотреть все идеи\n"
+    f"➕ — предложить свою идею\n"
+    f"💡 — узнать больше о {BIRTHDAY_PERSON_PREP}\n"
+    f"🎁 — посмотреть что вы покупаете\n"
+    f"📊 — общая статистика\n"
+)
+_EMPTY_LIST_TEXT = "📋 Список пока пуст!\n\nБудьте первым — добавьте идею подарка!"
+_EMPTY_MY_GIFTS_TEXT = (
+    "🎁 *Мои подарки*\n\n"
+    "Вы пока не записались ни на один подарок.\n"
+    "Загляните в список идей!"
+)
+_ADD_GIFT_TEXT = (
+    "➕ *Добавление идеи подарка*\n\n"
+    "Напишите название подарка:"
+)
+_ADMIN_PANEL_TEXT = (
+    "⚙️ *Админ-панель*\n\n"
+    "Команды:\n"
+    "📢 /broadcast — рассылка всем пользователям\n"
+    "📤 /export — скачать бэкап базы\n"
+    "📥 /import — восстановить из бэкапа\n"
+)
 
-def is_banned(user_id: int) -> bool:
+async def is_banned(user_id: int) -> bool:
     """Check if user is banned (the birthday person)"""
     return db.is_user_banned(user_id)
 
 
-def is_admin(user_id: int) -> bool:
+async def is_admin(user_id: int) -> bool:
     """Check if user is admin"""
-    if user_id == SUPER_ADMIN_ID:
-        return True
-    return db.is_admin(user_id)
+    return user_id == SUPER_ADMIN_ID or db.is_admin(user_id)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start command handler"""
     user = update.effective_user
     
-    # Track this user (before ban check so we can ban them later if needed!)
-    db.track_user(user.id, user.username, user.full_name)
-    
-    if is_banned(user.id):
+    if await is_banned(user.id):
         await update.message.reply_text(
             "🎂 Привет, именинник(ца)! 🎂\n\n"
             "Этот бот — секрет! Тебе сюда нельзя 😉\n"
@@ -109,9 +239,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
         return ConversationHandler.END
     
+    # Track this user so admins can pick them from the ban list later
+    await asyncio.to_thread(db.track_user, user.id, user.username, user.full_name)
+    
     # Auto-add first user as admin
     if not db.has_any_admin():
-        db.add_admin(user.id, user.full_name)
+        await asyncio.to_thread(db.add_admin, user.id, user.full_name)
         await update.message.reply_text(
             "👑 Вы первый пользователь — теперь вы администратор!"
         )
@@ -124,7 +257,7 @@ async def export_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Export database file (admin only)"""
     user = update.effective_user
     
-    if not is_admin(user.id):
+    if not await is_admin(user.id):
         await update.message.reply_text("❌ Только для администраторов")
         return
     
@@ -134,19 +267,22 @@ async def export_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text("📤 Отправляю базу данных...")
     
-    with open(DATABASE_PATH, 'rb') as f:
-        await update.message.reply_document(
-            document=f,
-            filename="gifts_backup.db",
-            caption="🗄 Бэкап базы данных\n\nСохраните этот файл!"
-        )
+    # Make sure recent writes are in the main file, not only in the WAL
+    await asyncio.to_thread(db.checkpoint)
+    
+    # Pass the path so PTB opens the file itself (a file:// reference in local mode)
+    await update.message.reply_document(
+        document=DATABASE_PATH,
+        filename="gifts_backup.db",
+        caption="🗄 Бэкап базы данных\n\nСохраните этот файл!"
+    )
 
 
 async def import_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Import database file (admin only)"""
     user = update.effective_user
     
-    if not is_admin(user.id):
+    if not await is_admin(user.id):
         await update.message.reply_text("❌ Только для администраторов")
         return
     
@@ -165,19 +301,35 @@ async def import_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Нужен файл с расширением .db")
         return
     
+    global db
+    tmp_path = DATABASE_PATH + ".import"
     try:
         file = await update.message.document.get_file()
-        await file.download_to_drive(DATABASE_PATH)
+        
+        # Download next to the live DB and validate before touching it
+        await file.download_to_drive(tmp_path)
+        if not await asyncio.to_thread(check_database_file, tmp_path):
+            os.remove(tmp_path)
+            await update.message.reply_text("❌ Файл повреждён или не является базой бота")
+            return
+        
+        # Release open connections so the old WAL can't be replayed onto the new file
+        await asyncio.to_thread(db.close)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(DATABASE_PATH + suffix):
+                os.remove(DATABASE_PATH + suffix)
+        os.replace(tmp_path, DATABASE_PATH)
         
         # Reinitialize database connection
-        global db
-        db = Database()
+        db = await asyncio.to_thread(Database)
         
         await update.message.reply_text(
             "✅ База данных успешно импортирована!\n\n"
             "Все данные восстановлены."
         )
     except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         await update.message.reply_text(f"❌ Ошибка импорта: {e}")
 
 
@@ -185,16 +337,12 @@ async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start broadcast process (admin only)"""
     user = update.effective_user
     
-    if not is_admin(user.id):
+    if not await is_admin(user.id):
         await update.message.reply_text("❌ Только для администраторов")
         return ConversationHandler.END
     
-    users = db.get_all_users()
-    banned = db.get_banned_users()
-    banned_ids = {b['user_id'] for b in banned}
-    
     # Count recipients (excluding banned)
-    recipients = [u for u in users if u['user_id'] not in banned_ids]
+    recipients = await asyncio.to_thread(db.get_broadcast_recipients)
     
     await update.message.reply_text(
         f"📢 *Рассылка сообщений*\n\n"
@@ -211,58 +359,83 @@ async def broadcast_preview(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Preview and confirm broadcast"""
     context.user_data['broadcast_text'] = update.message.text
     
-    keyboard = [
-        [InlineKeyboardButton("✅ Отправить всем", callback_data="broadcast_confirm")],
-        [InlineKeyboardButton("❌ Отмена", callback_data="broadcast_cancel")],
-    ]
-    
     await update.message.reply_text(
         f"📋 *Превью сообщения:*\n\n"
         f"{update.message.text}\n\n"
         f"─────────────────\n"
         f"Отправить это сообщение всем пользователям?",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_BROADCAST_CONFIRM_KB,
         parse_mode="Markdown"
     )
     return ConversationHandler.END
 
 
+_broadcast_semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+
+async def _send_broadcast_message(bot, chat_id: int, from_chat_id: int, message_id: int) -> bool:
+    """Copy the broadcast draft to one user, waiting out flood control; True if delivered"""
+    for _ in range(BROADCAST_MAX_RETRIES + 1):
+        try:
+            async with _broadcast_semaphore:
+                await bot.copy_message(
+                    chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id
+                )
+            return True
+        except RetryAfter as e:
+            delay = e.retry_after
+            if hasattr(delay, "total_seconds"):
+                delay = delay.total_seconds()
+            await asyncio.sleep(delay)
+        except Exception:
+            return False
+    return False
+
+
 async def broadcast_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send broadcast to all users"""
     query = update.callback_query
     await query.answer()
     
     user = update.effective_user
-    if not is_admin(user.id):
+    if not await is_admin(user.id):
         return
     
-    text = context.user_data.get('broadcast_text')
+    text = context.user_data.pop('broadcast_text', None)
     if not text:
         await query.edit_message_text("❌ Сообщение не найдено. Начните заново: /broadcast")
         return
     
     await query.edit_message_text("📤 Отправляю сообщения...")
     
-    users = db.get_all_users()
-    banned = db.get_banned_users()
-    banned_ids = {b['user_id'] for b in banned}
+    # Post the announcement once to the admin's chat, then copy it to everyone
+    # (no Markdown re-parsing per recipient)
+    admin_chat_id = update.effective_chat.id
+    try:
+        draft = await context.bot.send_message(
+            chat_id=admin_chat_id,
+            text=f"📢 *Объявление:*\n\n{text}",
+            parse_mode="Markdown"
+        )
+    except Exception as e:
+        await query.edit_message_text(f"❌ Не удалось подготовить рассылку: {e}")
+        return
     
+    recipients = await asyncio.to_thread(db.get_broadcast_recipients)
     sent = 0
-    failed = 0
     
-    for u in users:
-        if u['user_id'] in banned_ids:
-            continue
-        
-        try:
-            await context.bot.send_message(
-                chat_id=u['user_id'],
-                text=f"📢 *Объявление:*\n\n{text}",
-                parse_mode="Markdown"
-            )
-            sent += 1
-        except Exception:
-            failed += 1
+    # Send in paced batches to stay within Telegram's ~30 msg/s limit
+    for i in range(0, len(recipients), BROADCAST_BATCH_SIZE):
+        if i:
+            await asyncio.sleep(BROADCAST_INTERVAL)
+        batch = recipients[i:i + BROADCAST_BATCH_SIZE]
+        results = await asyncio.gather(
+            *(_send_broadcast_message(context.bot, uid, admin_chat_id, draft.message_id)
+              for uid in batch)
+        )
+        sent += sum(results)
+    failed = len(recipients) - sent
+    logger.info("Broadcast finished: sent=%d failed=%d", sent, failed)
     
     await query.edit_message_text(
         f"✅ *Рассылка завершена!*\n\n"
@@ -271,8 +444,6 @@ async def broadcast_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"_(Не доставлено = заблокировали бота)_",
         parse_mode="Markdown"
     )
-    
-    context.user_data.pop('broadcast_text', None)
 
 
 async def broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -290,112 +461,131 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show main menu"""
     user = update.effective_user
     
-    keyboard = [
-        [InlineKeyboardButton("📋 Список подарков", callback_data="list_gifts")],
-        [InlineKeyboardButton("➕ Добавить идею", callback_data="add_gift")],
-        [InlineKeyboardButton(f"💡 Узнать {BIRTHDAY_PERSON_ACC} лучше", callback_data="facts_menu")],
-        [InlineKeyboardButton("🎁 Мои подарки", callback_data="my_gifts")],
-        [InlineKeyboardButton("📊 Статистика", callback_data="stats")],
-    ]
-    
-    if is_admin(user.id):
-        keyboard.append([InlineKeyboardButton("⚙️ Админ-панель", callback_data="admin_panel")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    text = (
-        f"🎁 *Бот для сбора подарков* 🎁\n\n"
-        f"Здесь мы собираем идеи подарков для {BIRTHDAY_PERSON_GEN} и координируем покупки!\n\n"
-        f"📋 — посмотреть все идеи\n"
-        f"➕ — предложить свою идею\n"
-        f"💡 — узнать больше о {BIRTHDAY_PERSON_PREP}\n"
-        f"🎁 — посмотреть что вы покупаете\n"
-        f"📊 — общая статистика\n"
-    )
+    reply_markup = _MAIN_MENU_KB_ADMIN if await is_admin(user.id) else _MAIN_MENU_KB_USER
     
     if update.callback_query:
         await update.callback_query.edit_message_text(
-            text, reply_markup=reply_markup, parse_mode="Markdown"
+            _MAIN_MENU_TEXT, reply_markup=reply_markup, parse_mode="Markdown"
         )
     else:
         await update.message.reply_text(
-            text, reply_markup=reply_markup, parse_mode="Markdown"
+            _MAIN_MENU_TEXT, reply_markup=reply_markup, parse_mode="Markdown"
         )
 
 
-async def list_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List all gifts"""
+@lru_cache(maxsize=1024)
+def _render_gift_line(name: str, status_key: str, price: int, buyers: tuple) -> tuple:
+    """Render one gift-list line; buyers is a tuple of (user_name, amount)
+
+    Returns (status emoji, MarkdownV2 line). The arguments are the complete
+    input, so cached lines never go stale.
+    """
+    price_str = f"{price}₽" if price else "цена?"
+    
+    # Determine the right status icon
+    if status_key in ["bought", "already_has"]:
+        status = STATUS_EMOJI.get(status_key, "🟢")
+    elif status_key == "claimed" and buyers:
+        total_pledged = sum(amount or 0 for _, amount in buyers)
+        gift_price = price or 0
+
+        # Check if fully funded
+        if gift_price > 0 and total_pledged >= gift_price:
+            status = "🔴"  # Fully funded
+        # Check if it's a shared purchase (any buyer contributed less than full price)
+        elif any(amount and amount < gift_price for _, amount in buyers):
+            status = "👥"  # Sharing (even if only one person so far)
+        else:
+            status = "🟡"  # Single buyer who will buy solo
+    else:
+        status = STATUS_EMOJI.get(status_key, "🟢")
+    
+    buyer_info = ""
+    if buyers:
+        buyer_parts = []
+        for user_name, amount in buyers:
+            first_name = escape_md(user_name.split()[0])
+            if amount:
+                buyer_parts.append(f"{first_name} {amount}₽")
+            else:
+                buyer_parts.append(first_name)
+        buyer_info = f" \\- {', '.join(buyer_parts)}"
+    
+    return status, f"{status} {escape_md(name)} \\(\\~{escape_md(price_str)}\\){buyer_info}\n"
+
+
+async def list_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE, answered=False):
+    """List gifts, PAGE_SIZE per page (callback_data: list_gifts / list_gifts_p<N>)"""
     query = update.callback_query
-    await query.answer()
+    if not answered:
+        await query.answer()
     
-    gifts = db.get_all_gifts()
+    gifts = await asyncio.to_thread(db.get_all_gifts)
     
     if not gifts:
-        keyboard = [[InlineKeyboardButton("➕ Добавить первую идею", callback_data="add_gift")],
-                    [InlineKeyboardButton("🔙 Назад", callback_data="main_menu")]]
         await query.edit_message_text(
-            "📋 Список пока пуст!\n\nБудьте первым — добавьте идею подарка!",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            _EMPTY_LIST_TEXT,
+            reply_markup=_EMPTY_LIST_KB
         )
         return
     
-    # Group by category
-    by_category = {}
+    # Group by category, then flatten in display order
+    by_category = defaultdict(list)
     for gift in gifts:
-        cat = gift['category'] or 'other'
-        if cat not in by_category:
-            by_category[cat] = []
-        by_category[cat].append(gift)
+        by_category[gift['category'] or 'other'].append(gift)
+    ordered = [g for cat_key in _CATEGORY_ORDER for g in by_category.get(cat_key, ())]
+    
+    # Pick the requested page (1-based), clamped in case gifts were removed
+    total_pages = max(1, -(-len(ordered) // PAGE_SIZE))
+    page = 1
+    if query.data.startswith(LIST_PAGE_PREFIX):
+        page = int(query.data[len(LIST_PAGE_PREFIX):])
+    page = min(max(page, 1), total_pages)
+    page_gifts = ordered[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+    
+    # All buyers grouped by gift (one cached query shared by every page)
+    buyers_map = await asyncio.to_thread(db.get_all_buyers_grouped)
+    
+    header = "📋 *Список идей подарков:*"
+    if total_pages > 1:
+        header += f" \\(стр\\. {page}/{total_pages}\\)"
+    parts = [header, "\n\n"]
+    rendered = []  # (status, gift) in display order
+    current_cat = None
+    
+    for gift in page_gifts:
+        cat_key = gift['category'] or 'other'
+        if cat_key != current_cat:
+            current_cat = cat_key
+            parts.append(f"\n{escape_md(CATEGORIES[cat_key])}\n")
+        
+        buyers = buyers_map.get(gift['id'], ())
+        status, line = _render_gift_line(
+            gift['name'], gift['status'], gift['price'],
+            tuple((b['user_name'], b['amount']) for b in buyers)
+        )
+        parts.append(line)
+        rendered.append((status, gift))
     
-    text = "📋 *Список идей подарков:*\n\n"
-    keyboard = []
+    keyboard = [
+        [InlineKeyboardButton(f"{status} {gift['name'][:30]}", callback_data=f"gift_{gift['id']}")]
+        for status, gift in rendered
+    ]
     
-    for cat_key, cat_name in CATEGORIES.items():
-        if cat_key in by_category:
-            text += f"\n{escape_md(cat_name)}\n"
-            for gift in by_category[cat_key]:
-                price_str = f"{gift['price']}₽" if gift['price'] else "цена?"
-                buyers = db.get_gift_buyers(gift['id'])
-                
-                # Determine the right status icon
-                if gift['status'] in ["bought", "already_has"]:
-                    status = STATUS_EMOJI.get(gift['status'], "🟢")
-                elif gift['status'] == "claimed" and buyers:
-                    total_pledged = sum(b['amount'] or 0 for b in buyers)
-                    gift_price = gift['price'] or 0
-
-                    # Check if fully funded
-                    if gift_price > 0 and total_pledged >= gift_price:
-                        status = "🔴"  # Fully funded
-                    # Check if it's a shared purchase (any buyer contributed less than full price)
-                    elif any(b['amount'] and b['amount'] < gift_price for b in buyers):
-                        status = "👥"  # Sharing (even if only one person so far)
-                    else:
-                        status = "🟡"  # Single buyer who will buy solo
-                else:
-                    status = STATUS_EMOJI.get(gift['status'], "🟢")
-                
-                buyer_info = ""
-                if buyers:
-                    buyer_parts = []
-                    for b in buyers:
-                        name = escape_md(b['user_name'].split()[0])
-                        if b['amount']:
-                            buyer_parts.append(f"{name} {b['amount']}₽")
-                        else:
-                            buyer_parts.append(name)
-                    buyer_info = f" \\- {', '.join(buyer_parts)}"
-                
-                gift_name_escaped = escape_md(gift['name'])
-                text += f"{status} {gift_name_escaped} \\(\\~{escape_md(price_str)}\\){buyer_info}\n"
-                keyboard.append([InlineKeyboardButton(
-                    f"{status} {gift['name'][:30]}",
-                    callback_data=f"gift_{gift['id']}"
-                )])
+    if total_pages > 1:
+        nav_row = []
+        if page > 1:
+            nav_row.append(InlineKeyboardButton("◀️", callback_data=f"{LIST_PAGE_PREFIX}{page - 1}"))
+        nav_row.append(InlineKeyboardButton(f"{page}/{total_pages}", callback_data="noop"))
+        if page < total_pages:
+            nav_row.append(InlineKeyboardButton("▶️", callback_data=f"{LIST_PAGE_PREFIX}{page + 1}"))
+        keyboard.append(nav_row)
     
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
+    keyboard.append(_BACK_TO_MAIN_ROW)
+    
+    text = "".join(parts)
     
-    # Trim text if too long
+    # Trim text if too long (long names/buyer lists can still overflow a page)
     if len(text) > 4000:
         text = text[:4000] + "\n\n\\.\\.\\. \\(список сокращён\\)"
     
@@ -407,20 +597,31 @@ async def list_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-async def show_gift_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show details for a specific gift"""
+async def show_gift_details(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                            gift=None, buyers=None, answered=False, gift_id=None):
+    """Show details for a specific gift
+    
+    Callers that already hold fresh gift/buyers data can pass it in
+    to skip the DB reads. Pass answered=True when the callback query
+    has already been answered (e.g. with an alert), and gift_id when
+    query.data is not a gift_<id> button.
+    """
     query = update.callback_query
-    await query.answer()
+    if not answered:
+        await query.answer()
     
-    gift_id = int(query.data.split("_")[1])
-    gift = db.get_gift(gift_id)
+    if gift_id is None:
+        gift_id = int(query.data.rpartition("_")[2])
+    if gift is None:
+        gift = await asyncio.to_thread(db.get_gift, gift_id)
     
     if not gift:
         await query.edit_message_text("❌ Подарок не найден")
         return
     
     user = update.effective_user
-    buyers = db.get_gift_buyers(gift_id)
+    if buyers is None:
+        buyers = await asyncio.to_thread(db.get_gift_buyers, gift_id)
     
     # Calculate funding status
     total_pledged = sum(b['amount'] or 0 for b in buyers)
@@ -431,28 +632,14 @@ async def show_gift_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     is_sharing = any(b['amount'] and b['amount'] < gift_price for b in buyers)
 
     # Determine status emoji and text
-    if gift['status'] == "bought":
-        status = "✅"
-        status_text = "Уже куплен"
-    elif gift['status'] == "already_has":
-        status = "🚫"
-        status_text = "Уже есть у именинника"
-    elif gift['status'] == "claimed":
+    status_key = gift['status'] if gift['status'] in STATUS_TEXT else "available"
+    if status_key == "claimed":
         if is_fully_funded:
-            status = "🔴"
-            status_text = "Сумма собрана\\!"
+            status_key = "funded"
         elif is_sharing:
-            status = "👥"
-            if len(buyers) == 1:
-                status_text = "Ищут компанию для скидывания"
-            else:
-                status_text = "Скидываются несколько человек"
-        else:
-            status = "🟡"
-            status_text = "Кто\\-то покупает"
-    else:
-        status = "🟢"
-        status_text = "Свободен"
+            status_key = "shared" if len(buyers) == 1 else "shared_many"
+    status = STATUS_EMOJI[status_key]
+    status_text = STATUS_TEXT[status_key]
     
     price_str = f"{gift['price']}₽" if gift['price'] else "не указана"
     category = CATEGORIES.get(gift['category'], CATEGORIES['other'])
@@ -461,26 +648,27 @@ async def show_gift_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     gift_name = escape_md(gift['name'])
     added_by = escape_md(gift['added_by_name'])
     
-    text = (
+    parts = [
         f"🎁 *{gift_name}*\n\n"
         f"💰 Цена: \\~{escape_md(price_str)}\n"
         f"📁 Категория: {escape_md(category)}\n"
         f"📊 Статус: {status} {status_text}\n"
         f"💡 Добавил: {added_by}\n"
-    )
+    ]
     
     # Show funding progress if there are buyers
     if buyers and gift_price > 0:
         progress_pct = min(100, int(total_pledged / gift_price * 100))
-        text += f"\n💵 *Собрано:* {total_pledged} из {gift_price}₽ \\({progress_pct}%\\)\n"
+        parts.append(f"\n💵 *Собрано:* {total_pledged} из {gift_price}₽ \\({progress_pct}%\\)\n")
     
     if buyers:
-        text += "\n👥 *Участники:*\n"
+        parts.append("\n👥 *Участники:*\n")
         for buyer in buyers:
             buyer_name = escape_md(buyer['user_name'])
             amount = f" \\- {buyer['amount']}₽" if buyer['amount'] else " \\- сумма не указана"
-            text += f"  • {buyer_name}{amount}\n"
+            parts.append(f"  • {buyer_name}{amount}\n")
     
+    text = "".join(parts)
     keyboard = []
     
     # Check if current user is a buyer
@@ -501,7 +689,7 @@ async def show_gift_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if gift['status'] not in ["already_has", "bought"]:
         keyboard.append([InlineKeyboardButton("🚫 Уже есть у именинника", callback_data=f"already_has_{gift_id}")])
     
-    if is_admin(user.id):
+    if await is_admin(user.id):
         keyboard.append([InlineKeyboardButton("🗑 Удалить (админ)", callback_data=f"delete_{gift_id}")])
     
     keyboard.append([InlineKeyboardButton("🔙 К списку", callback_data="list_gifts")])
@@ -514,13 +702,50 @@ async def show_gift_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+# message key -> latest (update, context, gift_id, kwargs) waiting to be rendered
+_pending_refresh = {}
+# Strong references so scheduled refresh tasks aren't garbage collected
+_refresh_tasks = set()
+
+
+def schedule_gift_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                          gift_id: int, **kwargs):
+    """Re-render gift details after a short delay
+    
+    Repeated presses on the same message within REFRESH_DEBOUNCE are
+    coalesced into a single edit showing the latest state.
+    """
+    query = update.callback_query
+    if query.message:
+        key = (query.message.chat_id, query.message.message_id)
+    else:
+        key = query.inline_message_id
+    
+    pending = key in _pending_refresh
+    _pending_refresh[key] = (update, context, gift_id, kwargs)
+    if not pending:
+        task = asyncio.create_task(_debounced_refresh(key))
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+
+
+async def _debounced_refresh(key):
+    """Wait for the debounce window, then render the latest pending refresh"""
+    await asyncio.sleep(REFRESH_DEBOUNCE)
+    update, context, gift_id, kwargs = _pending_refresh.pop(key)
+    try:
+        await show_gift_details(update, context, answered=True, gift_id=gift_id, **kwargs)
+    except Exception:
+        logger.exception("Failed to refresh gift details")
+
+
 async def claim_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Claim a gift for yourself (buying solo)"""
     query = update.callback_query
     
-    gift_id = int(query.data.split("_")[1])
+    gift_id = int(query.data.rpartition("_")[2])
     user = update.effective_user
-    gift = db.get_gift(gift_id)
+    gift = await asyncio.to_thread(db.get_gift, gift_id)
     
     if not gift:
         await query.answer("❌ Подарок не найден", show_alert=True)
@@ -528,14 +753,13 @@ async def claim_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Set amount to full price when claiming solo
     amount = gift['price'] if gift['price'] else None
-    db.add_buyer(gift_id, user.id, user.full_name, amount)
-    db.update_gift_status(gift_id, "claimed")
+    await asyncio.to_thread(db.claim_gift, gift_id, user.id, user.full_name, amount)
+    gift['status'] = "claimed"
     
     await query.answer("✅ Отлично! Вы записались на этот подарок!", show_alert=True)
     
     # Refresh gift details
-    query.data = f"gift_{gift_id}"
-    await show_gift_details(update, context)
+    schedule_gift_refresh(update, context, gift_id, gift=gift)
 
 
 def get_contribution_options(price: int, existing_pledged: int = 0) -> list:
@@ -587,18 +811,17 @@ def get_contribution_options(price: int, existing_pledged: int = 0) -> list:
 async def share_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Join shared purchase - show contribution options or fixed amount"""
     query = update.callback_query
-    await query.answer()
 
-    gift_id = int(query.data.split("_")[1])
+    gift_id = int(query.data.rpartition("_")[2])
     user = update.effective_user
-    gift = db.get_gift(gift_id)
+    gift = await asyncio.to_thread(db.get_gift, gift_id)
 
     if not gift:
         await query.answer("❌ Подарок не найден", show_alert=True)
         return
 
     # Check if already participating
-    buyers = db.get_gift_buyers(gift_id)
+    buyers = await asyncio.to_thread(db.get_gift_buyers, gift_id)
     if any(b['user_id'] == user.id for b in buyers):
         await query.answer("Вы уже участвуете в покупке этого подарка!", show_alert=True)
         return
@@ -609,6 +832,8 @@ async def share_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("❌ Сумма уже полностью собрана!", show_alert=True)
         return
 
+    await query.answer()
+
     gift_price = gift['price'] or 0
     remaining = gift_price - total_pledged
 
@@ -681,26 +906,27 @@ async def select_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Handle contribution amount selection"""
     query = update.callback_query
     
-    parts = query.data.split("_")
-    gift_id = int(parts[1])
-    amount = int(parts[2])
+    context.user_data.pop('contribution_gift_id', None)
+    
+    # contrib_{gift_id}_{amount}
+    gift_str, _, amount_str = query.data[len("contrib_"):].partition("_")
+    gift_id = int(gift_str)
+    amount = int(amount_str)
     user = update.effective_user
     
     # Check if already participating
-    buyers = db.get_gift_buyers(gift_id)
+    buyers = await asyncio.to_thread(db.get_gift_buyers, gift_id)
     if any(b['user_id'] == user.id for b in buyers):
         await query.answer("Вы уже участвуете!", show_alert=True)
         return
     
     # Add buyer with amount
-    db.add_buyer(gift_id, user.id, user.full_name, amount)
-    db.update_gift_status(gift_id, "claimed")
+    await asyncio.to_thread(db.claim_gift, gift_id, user.id, user.full_name, amount)
     
     await query.answer(f"✅ Отлично! Вы вложили {amount}₽", show_alert=True)
     
     # Show gift details
-    query.data = f"gift_{gift_id}"
-    await show_gift_details(update, context)
+    schedule_gift_refresh(update, context, gift_id)
 
 
 async def set_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -714,12 +940,13 @@ async def set_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         amount = int(update.message.text.replace(" ", "").replace("₽", ""))
-        db.update_buyer_amount(gift_id, user.id, amount)
+        await asyncio.to_thread(db.update_buyer_amount, gift_id, user.id, amount)
         await update.message.reply_text(f"✅ Отлично! Записано: {amount}₽")
     except ValueError:
         await update.message.reply_text("❌ Пожалуйста, введите число")
         return SETTING_CONTRIBUTION
     
+    context.user_data.pop('contribution_gift_id', None)
     await show_main_menu(update, context)
     return ConversationHandler.END
 
@@ -727,6 +954,7 @@ async def set_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def skip_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Skip setting contribution amount"""
     query = update.callback_query
+    context.user_data.pop('contribution_gift_id', None)
     await query.answer("✅ Вы добавлены к покупке!", show_alert=True)
     await show_main_menu(update, context)
     return ConversationHandler.END
@@ -736,51 +964,38 @@ async def unclaim_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Remove yourself from gift"""
     query = update.callback_query
     
-    gift_id = int(query.data.split("_")[1])
+    gift_id = int(query.data.rpartition("_")[2])
     user = update.effective_user
     
-    db.remove_buyer(gift_id, user.id)
-    
-    # Check if any buyers left
-    buyers = db.get_gift_buyers(gift_id)
-    if not buyers:
-        db.update_gift_status(gift_id, "available")
+    # Frees the gift if no buyers are left
+    buyers = await asyncio.to_thread(db.unclaim_gift, gift_id, user.id)
     
     await query.answer("✅ Вы успешно отказались от покупки", show_alert=True)
     
-    query.data = f"gift_{gift_id}"
-    await show_gift_details(update, context)
+    schedule_gift_refresh(update, context, gift_id, buyers=buyers)
 
 
 async def mark_bought(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mark gift as bought"""
     query = update.callback_query
-    await query.answer()
-    
-    gift_id = int(query.data.split("_")[1])
-    db.update_gift_status(gift_id, "bought")
+    gift_id = int(query.data.rpartition("_")[2])
+    await asyncio.to_thread(db.update_gift_status, gift_id, "bought")
     
     await query.answer("🎉 Подарок помечен как купленный!", show_alert=True)
     
-    query.data = f"gift_{gift_id}"
-    await show_gift_details(update, context)
+    schedule_gift_refresh(update, context, gift_id)
 
 
 async def mark_already_has(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mark gift as 'already has'"""
     query = update.callback_query
-    await query.answer()
-    
-    gift_id = int(query.data.split("_")[1])
-    db.update_gift_status(gift_id, "already_has")
-    
+    gift_id = int(query.data.rpartition("_")[2])
     # Remove all buyers since gift is invalid now
-    db.remove_all_buyers(gift_id)
+    await asyncio.to_thread(db.mark_already_has, gift_id)
     
     await query.answer("🚫 Подарок помечен как 'уже есть'", show_alert=True)
     
-    query.data = f"gift_{gift_id}"
-    await show_gift_details(update, context)
+    schedule_gift_refresh(update, context, gift_id)
 
 
 async def start_add_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -788,12 +1003,9 @@ async def start_add_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    keyboard = [[InlineKeyboardButton("❌ Отмена", callback_data="main_menu")]]
-    
     await query.edit_message_text(
-        "➕ *Добавление идеи подарка*\n\n"
-        "Напишите название подарка:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        _ADD_GIFT_TEXT,
+        reply_markup=_CANCEL_TO_MAIN_KB,
         parse_mode="Markdown"
     )
     return ADDING_GIFT_NAME
@@ -803,13 +1015,11 @@ async def add_gift_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Save gift name and ask for price"""
     context.user_data['new_gift_name'] = update.message.text
     
-    keyboard = [[InlineKeyboardButton("Пропустить", callback_data="skip_price")]]
-    
     await update.message.reply_text(
         f"✅ Название: *{update.message.text}*\n\n"
         "💰 Укажите примерную цену (в рублях):\n"
         "Или нажмите 'Пропустить'",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_SKIP_PRICE_KB,
         parse_mode="Markdown"
     )
     return ADDING_GIFT_PRICE
@@ -840,16 +1050,12 @@ async def skip_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def ask_category(update: Update, context: ContextTypes.DEFAULT_TYPE, edit=False):
     """Ask for category"""
-    keyboard = []
-    for key, name in CATEGORIES.items():
-        keyboard.append([InlineKeyboardButton(name, callback_data=f"category_{key}")])
-    
     text = "📁 Выберите категорию:"
     
     if edit:
-        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        await update.callback_query.edit_message_text(text, reply_markup=_CATEGORY_KB)
     else:
-        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        await update.message.reply_text(text, reply_markup=_CATEGORY_KB)
 
 
 async def add_gift_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -857,10 +1063,11 @@ async def add_gift_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    category = query.data.split("_")[1]
+    category = query.data.partition("_")[2]
     user = update.effective_user
     
-    gift_id = db.add_gift(
+    gift_id = await asyncio.to_thread(
+        db.add_gift,
         name=context.user_data['new_gift_name'],
         price=context.user_data.get('new_gift_price'),
         category=category,
@@ -879,8 +1086,9 @@ async def add_gift_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="MarkdownV2"
     )
     
-    # Clear user data
-    context.user_data.clear()
+    # Clear this flow's state only
+    context.user_data.pop('new_gift_name', None)
+    context.user_data.pop('new_gift_price', None)
     
     await show_main_menu(update, context)
     return ConversationHandler.END
@@ -892,20 +1100,17 @@ async def my_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user = update.effective_user
-    gifts = db.get_user_gifts(user.id)
+    gifts = await asyncio.to_thread(db.get_user_gifts, user.id)
     
     if not gifts:
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="main_menu")]]
         await query.edit_message_text(
-            "🎁 *Мои подарки*\n\n"
-            "Вы пока не записались ни на один подарок.\n"
-            "Загляните в список идей!",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            _EMPTY_MY_GIFTS_TEXT,
+            reply_markup=_BACK_TO_MAIN_KB,
             parse_mode="Markdown"
         )
         return
     
-    text = "🎁 *Мои подарки:*\n\n"
+    parts = ["🎁 *Мои подарки:*\n\n"]
     keyboard = []
     
     for gift in gifts:
@@ -914,7 +1119,7 @@ async def my_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
         amount = f" \\(ваш вклад: {gift['amount']}₽\\)" if gift.get('amount') else ""
         
         gift_name = escape_md(gift['name'])
-        text += f"{status} {gift_name} \\(\\~{escape_md(price_str)}\\){amount}\n"
+        parts.append(f"{status} {gift_name} \\(\\~{escape_md(price_str)}\\){amount}\n")
         keyboard.append([InlineKeyboardButton(
             f"{status} {gift['name'][:30]}",
             callback_data=f"gift_{gift['id']}"
@@ -923,7 +1128,7 @@ async def my_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
     
     await query.edit_message_text(
-        text,
+        "".join(parts),
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode="MarkdownV2"
     )
@@ -934,7 +1139,7 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    stats = db.get_stats()
+    stats = await asyncio.to_thread(db.get_stats)
     
     text = (
         "📊 *Статистика:*\n\n"
@@ -947,11 +1152,9 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"💰 Собрано: ~{stats['total_amount']}₽"
     )
     
-    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="main_menu")]]
-    
     await query.edit_message_text(
         text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_BACK_TO_MAIN_KB,
         parse_mode="Markdown"
     )
 
@@ -963,13 +1166,7 @@ async def facts_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    facts_count = db.get_facts_count()
-    
-    keyboard = [
-        [InlineKeyboardButton(f"📖 Почитать о {BIRTHDAY_PERSON_PREP}", callback_data="read_facts")],
-        [InlineKeyboardButton(f"✏️ Рассказать о {BIRTHDAY_PERSON_PREP}", callback_data="add_fact")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="main_menu")],
-    ]
+    facts_count = await asyncio.to_thread(db.get_facts_count)
     
     text = (
         f"💡 *Узнать {BIRTHDAY_PERSON_ACC} лучше*\n\n"
@@ -981,7 +1178,7 @@ async def facts_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await query.edit_message_text(
         text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_FACTS_MENU_KB,
         parse_mode="Markdown"
     )
 
@@ -991,39 +1188,36 @@ async def read_facts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    facts = db.get_all_facts()
+    facts = await asyncio.to_thread(db.get_all_facts)
     
     if not facts:
-        keyboard = [
-            [InlineKeyboardButton(f"✏️ Рассказать первым!", callback_data="add_fact")],
-            [InlineKeyboardButton("🔙 Назад", callback_data="facts_menu")],
-        ]
         await query.edit_message_text(
             f"📖 *Что мы знаем о {BIRTHDAY_PERSON_PREP}:*\n\n"
             f"Пока ничего... 😅\n\n"
             f"Будьте первым — расскажите что-нибудь о {BIRTHDAY_PERSON_PREP}!",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=_NO_FACTS_KB,
             parse_mode="Markdown"
         )
         return
     
-    text = f"📖 *Что мы знаем о {BIRTHDAY_PERSON_PREP}:*\n\n"
+    parts = [f"📖 *Что мы знаем о {BIRTHDAY_PERSON_PREP}:*\n\n"]
+    length = len(parts[0])
     
     for fact in facts:
-        text += f"💬 _{fact['fact_text']}_\n\n"
-    
-    # Trim if too long
-    if len(text) > 3800:
-        text = text[:3800] + "\n\n... _(показаны не все записи)_"
+        piece = f"💬 _{fact['fact_text']}_\n\n"
+        # Trim if too long, without formatting the facts that won't fit
+        if length + len(piece) > FACTS_TEXT_LIMIT:
+            parts.append(piece[:FACTS_TEXT_LIMIT - length])
+            parts.append("\n\n... _(показаны не все записи)_")
+            break
+        parts.append(piece)
+        length += len(piece)
     
-    keyboard = [
-        [InlineKeyboardButton("✏️ Добавить своё", callback_data="add_fact")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="facts_menu")],
-    ]
+    text = "".join(parts)
     
     await query.edit_message_text(
         text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_READ_FACTS_KB,
         parse_mode="Markdown"
     )
 
@@ -1033,15 +1227,13 @@ async def start_add_fact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    keyboard = [[InlineKeyboardButton("❌ Отмена", callback_data="facts_menu")]]
-    
     await query.edit_message_text(
         f"✏️ *Расскажите что-нибудь о {BIRTHDAY_PERSON_PREP}!*\n\n"
         f"Чем увлекается {BIRTHDAY_PERSON}? Что любит есть и пить?\n"
         f"Как проводит свободное время? О чём мечтает?\n\n"
         f"Любая информация поможет гостям выбрать подарок.\n\n"
         f"_Напишите одним сообщением:_",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_CANCEL_TO_FACTS_KB,
         parse_mode="Markdown"
     )
     return ADDING_FACT
@@ -1064,19 +1256,13 @@ async def save_fact(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return ADDING_FACT
     
-    db.add_fact(user.id, fact_text)
-    
-    keyboard = [
-        [InlineKeyboardButton("✏️ Добавить ещё", callback_data="add_fact")],
-        [InlineKeyboardButton("📖 Почитать что пишут другие", callback_data="read_facts")],
-        [InlineKeyboardButton("🔙 В главное меню", callback_data="main_menu")],
-    ]
+    await asyncio.to_thread(db.add_fact, user.id, fact_text)
     
     await update.message.reply_text(
         f"✅ *Спасибо! Ваш рассказ сохранён.*\n\n"
         f"Вы написали:\n"
         f"_{fact_text}_",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_FACT_SAVED_KB,
         parse_mode="Markdown"
     )
     
@@ -1085,31 +1271,20 @@ async def save_fact(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ============ ADMIN FUNCTIONS ============
 
-async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE, answered=False):
     """Show admin panel"""
     query = update.callback_query
-    await query.answer()
     
     user = update.effective_user
-    if not is_admin(user.id):
+    if not await is_admin(user.id):
         await query.answer("❌ Только для администраторов", show_alert=True)
         return
-    
-    keyboard = [
-        [InlineKeyboardButton("🚫 Забанить именинника", callback_data="admin_ban")],
-        [InlineKeyboardButton("✅ Разбанить пользователя", callback_data="admin_unban")],
-        [InlineKeyboardButton("👑 Добавить админа", callback_data="admin_add")],
-        [InlineKeyboardButton("📋 Список забаненных", callback_data="admin_banned_list")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="main_menu")],
-    ]
+    if not answered:
+        await query.answer()
     
     await query.edit_message_text(
-        "⚙️ *Админ-панель*\n\n"
-        "Команды:\n"
-        "📢 /broadcast — рассылка всем пользователям\n"
-        "📤 /export — скачать бэкап базы\n"
-        "📥 /import — восстановить из бэкапа\n",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        _ADMIN_PANEL_TEXT,
+        reply_markup=_ADMIN_PANEL_KB,
         parse_mode="Markdown"
     )
 
@@ -1119,12 +1294,6 @@ async def admin_ban_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("📋 Выбрать из списка", callback_data="ban_from_list")],
-        [InlineKeyboardButton("✏️ Ввести ID вручную", callback_data="ban_manual")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="admin_panel")],
-    ]
-    
     await query.edit_message_text(
         "🚫 *Забанить именинника*\n\n"
         "Выберите способ:\n\n"
@@ -1132,31 +1301,41 @@ async def admin_ban_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "✏️ *Вручную* — ввести Telegram ID\n\n"
         "💡 _Совет: попросите именинника написать боту /start до того, "
         "как вы его забаните — тогда он появится в списке_",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_ADMIN_BAN_KB,
         parse_mode="Markdown"
     )
     return ConversationHandler.END
 
 
 async def ban_from_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show list of users to ban"""
+    """Show list of users to ban, BAN_LIST_PAGE_SIZE per page"""
     query = update.callback_query
     await query.answer()
     
-    users = db.get_all_users()
+    # Cursor is the last row of the previous page: ban_list_after_<last_seen>_<id>
+    # (last_seen is carried in the button, the user may /start in between)
+    after_seen = after_id = None
+    if query.data.startswith(BAN_LIST_PAGE_PREFIX):
+        after_seen, _, id_str = query.data[len(BAN_LIST_PAGE_PREFIX):].rpartition("_")
+        after_id = int(id_str)
+    # One extra row tells us whether there is a next page
+    users = await asyncio.to_thread(
+        db.get_users_page, BAN_LIST_PAGE_SIZE + 1, after_seen, after_id
+    )
+    has_next = len(users) > BAN_LIST_PAGE_SIZE
+    users = users[:BAN_LIST_PAGE_SIZE]
     
-    if not users:
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_ban")]]
+    if not users and after_id is None:
         await query.edit_message_text(
             "📋 Список пуст!\n\n"
             "Пока никто не писал боту.\n"
             "Попросите именинника написать /start",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=_BACK_TO_ADMIN_BAN_KB
         )
         return
     
     keyboard = []
-    for u in users[:20]:  # Limit to 20 users
+    for u in users:
         display_name = u['full_name'] or u['username'] or f"ID: {u['user_id']}"
         username_str = f" (@{u['username']})" if u['username'] else ""
         keyboard.append([InlineKeyboardButton(
@@ -1164,6 +1343,16 @@ async def ban_from_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
             callback_data=f"confirm_ban_{u['user_id']}"
         )])
     
+    nav_row = []
+    if after_id is not None:
+        nav_row.append(InlineKeyboardButton("⏮ В начало", callback_data="ban_from_list"))
+    if has_next:
+        last = users[-1]
+        nav_row.append(InlineKeyboardButton(
+            "Ещё ▶️", callback_data=f"{BAN_LIST_PAGE_PREFIX}{last['last_seen']}_{last['user_id']}"
+        ))
+    if nav_row:
+        keyboard.append(nav_row)
     keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_ban")])
     
     await query.edit_message_text(
@@ -1179,17 +1368,17 @@ async def confirm_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    user_id = int(query.data.split("_")[2])
+    user_id = int(query.data.rpartition("_")[2])
     context.user_data['ban_target_id'] = user_id
     
     # Try to get user info
-    users = db.get_all_users()
-    target_user = next((u for u in users if u['user_id'] == user_id), None)
+    target_user = await asyncio.to_thread(db.get_user, user_id)
     
     if target_user:
         name = target_user['full_name'] or target_user['username'] or str(user_id)
     else:
         name = str(user_id)
+    context.user_data['ban_target_name'] = name
     
     keyboard = [
         [InlineKeyboardButton("✅ Да, забанить!", callback_data=f"do_ban_{user_id}")],
@@ -1212,14 +1401,18 @@ async def do_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    user_id = int(query.data.split("_")[2])
+    user_id = int(query.data.rpartition("_")[2])
     
-    # Get user info for the name
-    users = db.get_all_users()
-    target_user = next((u for u in users if u['user_id'] == user_id), None)
-    name = target_user['full_name'] if target_user else "Пользователь"
+    # Name was already looked up by confirm_ban
+    if context.user_data.pop('ban_target_id', None) == user_id:
+        name = context.user_data.pop('ban_target_name', "Пользователь")
+    else:
+        context.user_data.pop('ban_target_name', None)
+        target_user = await asyncio.to_thread(db.get_user, user_id)
+        name = target_user['full_name'] if target_user else "Пользователь"
     
-    db.ban_user(user_id, name)
+    # Overlap the DB write with the Telegram round-trip
+    ban_task = asyncio.create_task(asyncio.to_thread(db.ban_user, user_id, name))
     
     await query.edit_message_text(
         f"✅ *Готово!*\n\n"
@@ -1227,6 +1420,7 @@ async def do_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Теперь он не сможет видеть список подарков!",
         parse_mode="Markdown"
     )
+    await ban_task
     
     # Return to admin panel after a moment
     await show_main_menu(update, context)
@@ -1237,8 +1431,6 @@ async def ban_manual_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    keyboard = [[InlineKeyboardButton("❌ Отмена", callback_data="admin_ban")]]
-    
     await query.edit_message_text(
         "✏️ *Ввод ID вручную*\n\n"
         "Отправьте Telegram ID пользователя (только цифры).\n\n"
@@ -1246,7 +1438,7 @@ async def ban_manual_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "1. Именинник пишет боту @userinfobot\n"
         "2. Бот присылает его ID\n"
         "3. Именинник говорит вам этот ID",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_CANCEL_TO_ADMIN_BAN_KB,
         parse_mode="Markdown"
     )
     return BANNING_USER
@@ -1255,7 +1447,7 @@ async def ban_manual_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def admin_ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ban a user by ID input"""
     user = update.effective_user
-    if not is_admin(user.id):
+    if not await is_admin(user.id):
         return ConversationHandler.END
     
     text = update.message.text.strip()
@@ -1277,7 +1469,7 @@ async def admin_ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Вы не можете забанить самого себя!")
         return BANNING_USER
     
-    db.ban_user(target_id, f"ID: {target_id}")
+    await asyncio.to_thread(db.ban_user, target_id, f"ID: {target_id}")
     
     await update.message.reply_text(
         f"✅ Пользователь с ID `{target_id}` забанен!\n"
@@ -1294,13 +1486,12 @@ async def admin_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    banned = db.get_banned_users()
+    banned = await asyncio.to_thread(db.get_banned_users)
     
     if not banned:
-        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_panel")]]
         await query.edit_message_text(
             "Нет забаненных пользователей",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=_BACK_TO_ADMIN_KB
         )
         return
     
@@ -1321,13 +1512,13 @@ async def admin_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def do_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Actually unban user"""
     query = update.callback_query
-    await query.answer()
     
-    user_id = int(query.data.split("_")[1])
-    db.unban_user(user_id)
+    user_id = int(query.data.rpartition("_")[2])
+    unban_task = asyncio.create_task(asyncio.to_thread(db.unban_user, user_id))
     
     await query.answer("✅ Пользователь разбанен!", show_alert=True)
-    await admin_panel(update, context)
+    await unban_task
+    await admin_panel(update, context, answered=True)
 
 
 async def admin_banned_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1335,20 +1526,19 @@ async def admin_banned_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    banned = db.get_banned_users()
+    banned = await asyncio.to_thread(db.get_banned_users)
     
     if not banned:
         text = "Нет забаненных пользователей"
     else:
-        text = "🚫 *Забаненные пользователи:*\n\n"
+        parts = ["🚫 *Забаненные пользователи:*\n\n"]
         for user in banned:
-            text += f"• {user['name']} (ID: {user['user_id']})\n"
-    
-    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_panel")]]
+            parts.append(f"• {user['name']} (ID: {user['user_id']})\n")
+        text = "".join(parts)
     
     await query.edit_message_text(
         text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=_BACK_TO_ADMIN_KB,
         parse_mode="Markdown"
     )
 
@@ -1372,15 +1562,17 @@ async def delete_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     
     user = update.effective_user
-    if not is_admin(user.id):
+    if not await is_admin(user.id):
         await query.answer("❌ Только для администраторов", show_alert=True)
         return
     
-    gift_id = int(query.data.split("_")[1])
-    db.delete_gift(gift_id)
+    gift_id = int(query.data.rpartition("_")[2])
+    delete_task = asyncio.create_task(asyncio.to_thread(db.delete_gift, gift_id))
     
     await query.answer("🗑 Подарок удалён!", show_alert=True)
-    await list_gifts(update, context)
+    # The refreshed list must not show the deleted gift
+    await delete_task
+    await list_gifts(update, context, answered=True)
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1394,9 +1586,85 @@ async def handle_main_menu_callback(update: Update, context: ContextTypes.DEFAUL
     """Handle main menu button press"""
     query = update.callback_query
     await query.answer()
+    # Leaving the add-gift flow via "Отмена" drops its half-filled state
+    context.user_data.pop('new_gift_name', None)
+    context.user_data.pop('new_gift_price', None)
     await show_main_menu(update, context)
 
 
+async def noop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Label-only button (e.g. page counter) - just stop the spinner"""
+    await update.callback_query.answer()
+
+
+# ============ CALLBACK DISPATCH ============
+
+# Precompiled patterns for conversation-bound buttons
+_P_ADD_GIFT = re.compile(r"^add_gift$")
+_P_MAIN_MENU = re.compile(r"^main_menu$")
+_P_SKIP_PRICE = re.compile(r"^skip_price$")
+_P_CATEGORY = re.compile(r"^category_")
+_P_BAN_MANUAL = re.compile(r"^ban_manual$")
+_P_ADMIN_BAN = re.compile(r"^admin_ban$")
+_P_ADD_FACT = re.compile(r"^add_fact$")
+_P_FACTS_MENU = re.compile(r"^facts_menu$")
+
+# Exact callback_data -> handler
+CALLBACK_ROUTES = {
+    "main_menu": handle_main_menu_callback,
+    "list_gifts": list_gifts,
+    "my_gifts": my_gifts,
+    "stats": show_stats,
+    "facts_menu": facts_menu,
+    "read_facts": read_facts,
+    "broadcast_confirm": broadcast_confirm,
+    "broadcast_cancel": broadcast_cancel,
+    "admin_panel": admin_panel,
+    "admin_ban": admin_ban_start,
+    "ban_from_list": ban_from_list,
+    "admin_unban": admin_unban,
+    "admin_banned_list": admin_banned_list,
+    "admin_add": admin_add_start,
+    "noop": noop_callback,
+}
+
+# First token of callback_data -> (full prefix, handler) for buttons carrying IDs
+CALLBACK_PREFIX_ROUTES = {
+    "confirm": ("confirm_ban_", confirm_ban),
+    "do": ("do_ban_", do_ban),
+    "unban": ("unban_", do_unban),
+    "gift": ("gift_", show_gift_details),
+    "claim": ("claim_", claim_gift),
+    "share": ("share_", share_gift),
+    "contrib": ("contrib_", select_contribution),
+    "unclaim": ("unclaim_", unclaim_gift),
+    "bought": ("bought_", mark_bought),
+    "already": ("already_has_", mark_already_has),
+    "list": (LIST_PAGE_PREFIX, list_gifts),
+    "ban": (BAN_LIST_PAGE_PREFIX, ban_from_list),
+    "delete": ("delete_", delete_gift),
+}
+
+
+async def dispatch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Route a callback query to its handler with dict lookups"""
+    query = update.callback_query
+    data = query.data or ""
+    
+    handler = CALLBACK_ROUTES.get(data)
+    if handler is None:
+        route = CALLBACK_PREFIX_ROUTES.get(data.partition("_")[0])
+        if route and data.startswith(route[0]):
+            handler = route[1]
+    
+    if handler is None:
+        # Stale button from a finished conversation - just stop the spinner
+        await query.answer()
+        return
+    
+    await handler(update, context)
+
+
 def main():
     """Main function to run the bot"""
     token = os.environ.get("BOT_TOKEN")
@@ -1409,29 +1677,30 @@ def main():
     
     # Conversation handler for adding gifts
     add_gift_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(start_add_gift, pattern="^add_gift$")],
+        entry_points=[CallbackQueryHandler(start_add_gift, pattern=_P_ADD_GIFT)],
         states={
             ADDING_GIFT_NAME: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, add_gift_name),
-                CallbackQueryHandler(handle_main_menu_callback, pattern="^main_menu$"),
+                CallbackQueryHandler(handle_main_menu_callback, pattern=_P_MAIN_MENU),
             ],
             ADDING_GIFT_PRICE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, add_gift_price),
-                CallbackQueryHandler(skip_price, pattern="^skip_price$"),
+                CallbackQueryHandler(skip_price, pattern=_P_SKIP_PRICE),
             ],
             ADDING_GIFT_CATEGORY: [
-                CallbackQueryHandler(add_gift_category, pattern="^category_"),
+                CallbackQueryHandler(add_gift_category, pattern=_P_CATEGORY),
             ],
         },
         fallbacks=[
             CommandHandler("cancel", cancel),
-            CallbackQueryHandler(handle_main_menu_callback, pattern="^main_menu$"),
+            CallbackQueryHandler(handle_main_menu_callback, pattern=_P_MAIN_MENU),
         ],
+        block=False,
     )
     
     # Conversation handler for banning (manual ID input)
     ban_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(ban_manual_start, pattern="^ban_manual$")],
+        entry_points=[CallbackQueryHandler(ban_manual_start, pattern=_P_BAN_MANUAL)],
         states={
             BANNING_USER: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, admin_ban_user),
@@ -1439,13 +1708,14 @@ def main():
         },
         fallbacks=[
             CommandHandler("cancel", cancel),
-            CallbackQueryHandler(admin_ban_start, pattern="^admin_ban$"),
+            CallbackQueryHandler(admin_ban_start, pattern=_P_ADMIN_BAN),
         ],
+        block=False,
     )
     
     # Conversation handler for adding facts
     facts_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(start_add_fact, pattern="^add_fact$")],
+        entry_points=[CallbackQueryHandler(start_add_fact, pattern=_P_ADD_FACT)],
         states={
             ADDING_FACT: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, save_fact),
@@ -1453,8 +1723,9 @@ def main():
         },
         fallbacks=[
             CommandHandler("cancel", cancel),
-            CallbackQueryHandler(facts_menu, pattern="^facts_menu$"),
+            CallbackQueryHandler(facts_menu, pattern=_P_FACTS_MENU),
         ],
+        block=False,
     )
     
     # Conversation handler for broadcast
@@ -1468,45 +1739,23 @@ def main():
         fallbacks=[
             CommandHandler("cancel", cancel),
         ],
+        block=False,
     )
     
-    # Add handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("menu", start))
-    application.add_handler(CommandHandler("export", export_db))
-    application.add_handler(MessageHandler(filters.Document.ALL & filters.COMMAND, import_db))
-    application.add_handler(CommandHandler("import", import_db))
+    # Add handlers (block=False: updates are processed concurrently, so one
+    # slow handler doesn't hold up everyone else)
+    application.add_handler(CommandHandler("start", start, block=False))
+    application.add_handler(CommandHandler("menu", start, block=False))
+    application.add_handler(CommandHandler("export", export_db, block=False))
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.COMMAND, import_db, block=False))
+    application.add_handler(CommandHandler("import", import_db, block=False))
     application.add_handler(add_gift_handler)
     application.add_handler(ban_handler)
     application.add_handler(facts_handler)
     application.add_handler(broadcast_handler)
     
-    # Callback query handlers
-    application.add_handler(CallbackQueryHandler(handle_main_menu_callback, pattern="^main_menu$"))
-    application.add_handler(CallbackQueryHandler(list_gifts, pattern="^list_gifts$"))
-    application.add_handler(CallbackQueryHandler(my_gifts, pattern="^my_gifts$"))
-    application.add_handler(CallbackQueryHandler(show_stats, pattern="^stats$"))
-    application.add_handler(CallbackQueryHandler(facts_menu, pattern="^facts_menu$"))
-    application.add_handler(CallbackQueryHandler(read_facts, pattern="^read_facts$"))
-    application.add_handler(CallbackQueryHandler(broadcast_confirm, pattern="^broadcast_confirm$"))
-    application.add_handler(CallbackQueryHandler(broadcast_cancel, pattern="^broadcast_cancel$"))
-    application.add_handler(CallbackQueryHandler(admin_panel, pattern="^admin_panel$"))
-    application.add_handler(CallbackQueryHandler(admin_ban_start, pattern="^admin_ban$"))
-    application.add_handler(CallbackQueryHandler(ban_from_list, pattern="^ban_from_list$"))
-    application.add_handler(CallbackQueryHandler(confirm_ban, pattern="^confirm_ban_"))
-    application.add_handler(CallbackQueryHandler(do_ban, pattern="^do_ban_"))
-    application.add_handler(CallbackQueryHandler(admin_unban, pattern="^admin_unban$"))
-    application.add_handler(CallbackQueryHandler(do_unban, pattern="^unban_"))
-    application.add_handler(CallbackQueryHandler(admin_banned_list, pattern="^admin_banned_list$"))
-    application.add_handler(CallbackQueryHandler(admin_add_start, pattern="^admin_add$"))
-    application.add_handler(CallbackQueryHandler(show_gift_details, pattern="^gift_"))
-    application.add_handler(CallbackQueryHandler(claim_gift, pattern="^claim_"))
-    application.add_handler(CallbackQueryHandler(share_gift, pattern="^share_"))
-    application.add_handler(CallbackQueryHandler(select_contribution, pattern="^contrib_"))
-    application.add_handler(CallbackQueryHandler(unclaim_gift, pattern="^unclaim_"))
-    application.add_handler(CallbackQueryHandler(mark_bought, pattern="^bought_"))
-    application.add_handler(CallbackQueryHandler(mark_already_has, pattern="^already_has_"))
-    application.add_handler(CallbackQueryHandler(delete_gift, pattern="^delete_"))
+    # All other buttons go through a single dispatcher
+    application.add_handler(CallbackQueryHandler(dispatch_callback, block=False))
     
     # Start the bot
     logger.info("Starting bot...")
@@ -5,29 +5,152 @@ Uses SQLite for data persistence
 
 import sqlite3
 import os
-from typing import Optional, List, Dict, Any
+import sys
+import time
+import threading
+from typing import Optional, List, Dict, Any, Set
 from contextlib import contextmanager
 
 DATABASE_PATH = os.environ.get("DATABASE_PATH", "gifts.db")
 
+# Per-connection SQLite tuning (WAL itself is persistent, set in _init_db)
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA cache_size=-20000",
+)
+
+# Upper bound on how long cached query results (gift list, stats, buyers,
+# banned users) are served from memory (seconds); every write to the
+# underlying tables invalidates them immediately
+QUERY_CACHE_TTL = 60
+
+# Display order of gift statuses; the gift list index is built on this exact
+# expression so that get_all_gifts reads rows already sorted
+STATUS_RANK_SQL = """CASE status
+    WHEN 'available' THEN 1
+    WHEN 'claimed' THEN 2
+    WHEN 'bought' THEN 3
+    WHEN 'already_has' THEN 4
+END"""
+
+
+def _intern_gift(row: sqlite3.Row) -> Dict[str, Any]:
+    """Convert a gift row to a dict with interned status/category strings
+    (cheap identity compares against literals, one copy shared by all rows)"""
+    gift = dict(row)
+    for key in ('status', 'category'):
+        if gift[key] is not None:
+            gift[key] = sys.intern(gift[key])
+    return gift
+
+
+def check_database_file(path: str) -> bool:
+    """Check that a file is an intact SQLite database with the gifts table"""
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                return False
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'gifts'"
+            ).fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return False
+
+
+class QueryCache:
+    """In-memory cache for read-heavy queries, versioned by writes"""
+    
+    def __init__(self, ttl: float = QUERY_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._entries = {}
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Get cached value or None if missing/expired/stale"""
+        entry = self._entries.get(key)
+        if entry and entry[2] == self.version and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+    
+    def set(self, key: str, value: Any, version: int):
+        """Store value read at the given version (dropped if a write happened since)"""
+        if version == self.version:
+            self._entries[key] = (value, time.monotonic() + self.ttl, version)
+    
+    def invalidate(self):
+        """Drop everything (called after any write to the cached tables)"""
+        self.version += 1
+        self._entries.clear()
+
 
 class Database:
     def __init__(self, db_path: str = None):
         self.db_path = db_path or DATABASE_PATH
+        self.gift_cache = QueryCache()
+        self.ban_cache = QueryCache()
+        # One long-lived connection per worker thread (handlers run DB calls
+        # via asyncio.to_thread), tracked so close() can release them all
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self._init_db()
+        # Banned/admin IDs mirrored in memory; the ban and admin write
+        # methods keep them in sync
+        self._banned_ids = self._load_ids("banned_users")
+        self._admin_ids = self._load_ids("admins")
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
     
     @contextmanager
     def _get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """Context manager for database connections (one transaction)"""
+        conn = self._connect()
         try:
             yield conn
             conn.commit()
         except Exception:
             conn.rollback()
             raise
-        finally:
+    
+    @contextmanager
+    def transaction(self):
+        """Write transaction taken with BEGIN IMMEDIATE; yields a cursor
+        
+        Grabbing the write lock up front keeps read-then-write sequences
+        atomic and avoids a failed lock upgrade half-way through.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            yield cursor
+    
+    def checkpoint(self):
+        """Flush the WAL into the main database file (e.g. before a backup)"""
+        with self._get_connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    
+    def close(self):
+        """Close all open connections (e.g. before replacing the DB file)"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
             conn.close()
     
     def _init_db(self):
@@ -35,6 +158,9 @@ class Database:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
+            # WAL lets readers run alongside the writer
+            cursor.execute("PRAGMA journal_mode=WAL")
+            
             # Gifts table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS gifts (
@@ -101,6 +227,15 @@ class Database:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            
+            # Indexes for hot lookups (buyers.gift_id is already covered
+            # by the UNIQUE(gift_id, user_id) index)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_buyers_user ON buyers(user_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_gifts_status ON gifts(status)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_gifts_category ON gifts(category)")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_gifts_rank ON gifts({STATUS_RANK_SQL}, category, name)"
+            )
     
     # ============ GIFT OPERATIONS ============
     
@@ -113,7 +248,9 @@ class Database:
                 INSERT INTO gifts (name, price, category, added_by_id, added_by_name)
                 VALUES (?, ?, ?, ?, ?)
             """, (name, price, category, added_by_id, added_by_name))
-            return cursor.lastrowid
+            gift_id = cursor.lastrowid
+        self.gift_cache.invalidate()
+        return gift_id
     
     def get_gift(self, gift_id: int) -> Optional[Dict[str, Any]]:
         """Get a single gift by ID"""
@@ -121,25 +258,20 @@ class Database:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM gifts WHERE id = ?", (gift_id,))
             row = cursor.fetchone()
-            return dict(row) if row else None
+            return _intern_gift(row) if row else None
     
     def get_all_gifts(self) -> List[Dict[str, Any]]:
-        """Get all gifts"""
+        """Get all gifts (cached, do not mutate the result)"""
+        cached = self.gift_cache.get('gifts')
+        if cached is not None:
+            return cached
+        version = self.gift_cache.version
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM gifts 
-                ORDER BY 
-                    CASE status 
-                        WHEN 'available' THEN 1 
-                        WHEN 'claimed' THEN 2 
-                        WHEN 'bought' THEN 3 
-                        WHEN 'already_has' THEN 4 
-                    END,
-                    category,
-                    name
-            """)
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute(f"SELECT * FROM gifts ORDER BY {STATUS_RANK_SQL}, category, name")
+            gifts = [_intern_gift(row) for row in cursor.fetchall()]
+        self.gift_cache.set('gifts', gifts, version)
+        return gifts
     
     def update_gift_status(self, gift_id: int, status: str):
         """Update gift status"""
@@ -149,14 +281,25 @@ class Database:
                 "UPDATE gifts SET status = ? WHERE id = ?",
                 (status, gift_id)
             )
+        self.gift_cache.invalidate()
+    
+    def mark_already_has(self, gift_id: int):
+        """Mark gift as 'already has' and drop its buyers in one transaction"""
+        with self.transaction() as cursor:
+            cursor.execute(
+                "UPDATE gifts SET status = 'already_has' WHERE id = ?",
+                (gift_id,)
+            )
+            cursor.execute("DELETE FROM buyers WHERE gift_id = ?", (gift_id,))
+        self.gift_cache.invalidate()
     
     def delete_gift(self, gift_id: int):
         """Delete a gift"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
+        with self.transaction() as cursor:
             # Delete buyers first (foreign key)
             cursor.execute("DELETE FROM buyers WHERE gift_id = ?", (gift_id,))
             cursor.execute("DELETE FROM gifts WHERE id = ?", (gift_id,))
+        self.gift_cache.invalidate()
     
     # ============ BUYER OPERATIONS ============
     
@@ -166,9 +309,30 @@ class Database:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT OR REPLACE INTO buyers (gift_id, user_id, user_name, amount)
+                INSERT INTO buyers (gift_id, user_id, user_name, amount)
                 VALUES (?, ?, ?, ?)
+                ON CONFLICT(gift_id, user_id) DO UPDATE SET
+                    user_name = excluded.user_name,
+                    amount = excluded.amount
             """, (gift_id, user_id, user_name, amount))
+        self.gift_cache.invalidate()
+    
+    def claim_gift(self, gift_id: int, user_id: int, user_name: str,
+                   amount: Optional[int] = None):
+        """Add a buyer and mark the gift as claimed in one transaction"""
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO buyers (gift_id, user_id, user_name, amount)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(gift_id, user_id) DO UPDATE SET
+                    user_name = excluded.user_name,
+                    amount = excluded.amount
+            """, (gift_id, user_id, user_name, amount))
+            cursor.execute(
+                "UPDATE gifts SET status = 'claimed' WHERE id = ?",
+                (gift_id,)
+            )
+        self.gift_cache.invalidate()
     
     def update_buyer_amount(self, gift_id: int, user_id: int, amount: int):
         """Update buyer's contribution amount"""
@@ -178,6 +342,7 @@ class Database:
                 UPDATE buyers SET amount = ? 
                 WHERE gift_id = ? AND user_id = ?
             """, (amount, gift_id, user_id))
+        self.gift_cache.invalidate()
     
     def remove_buyer(self, gift_id: int, user_id: int):
         """Remove a buyer from a gift"""
@@ -187,12 +352,37 @@ class Database:
                 "DELETE FROM buyers WHERE gift_id = ? AND user_id = ?",
                 (gift_id, user_id)
             )
+        self.gift_cache.invalidate()
+    
+    def unclaim_gift(self, gift_id: int, user_id: int) -> List[Dict[str, Any]]:
+        """Remove a buyer, freeing the gift if nobody is left (one transaction)
+        
+        Returns the remaining buyers.
+        """
+        with self.transaction() as cursor:
+            cursor.execute(
+                "DELETE FROM buyers WHERE gift_id = ? AND user_id = ?",
+                (gift_id, user_id)
+            )
+            cursor.execute("""
+                SELECT * FROM buyers WHERE gift_id = ?
+                ORDER BY created_at
+            """, (gift_id,))
+            buyers = [dict(row) for row in cursor.fetchall()]
+            if not buyers:
+                cursor.execute(
+                    "UPDATE gifts SET status = 'available' WHERE id = ?",
+                    (gift_id,)
+                )
+        self.gift_cache.invalidate()
+        return buyers
     
     def remove_all_buyers(self, gift_id: int):
         """Remove all buyers from a gift"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM buyers WHERE gift_id = ?", (gift_id,))
+        self.gift_cache.invalidate()
     
     def get_gift_buyers(self, gift_id: int) -> List[Dict[str, Any]]:
         """Get all buyers for a gift"""
@@ -204,6 +394,21 @@ class Database:
             """, (gift_id,))
             return [dict(row) for row in cursor.fetchall()]
     
+    def get_all_buyers_grouped(self) -> Dict[int, List[Dict[str, Any]]]:
+        """Get all buyers grouped by gift ID (cached, do not mutate the result)"""
+        cached = self.gift_cache.get('buyers')
+        if cached is not None:
+            return cached
+        version = self.gift_cache.version
+        result = {}
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM buyers ORDER BY created_at")
+            for row in cursor.fetchall():
+                result.setdefault(row['gift_id'], []).append(dict(row))
+        self.gift_cache.set('buyers', result, version)
+        return result
+    
     def get_user_gifts(self, user_id: int) -> List[Dict[str, Any]]:
         """Get all gifts a user is buying"""
         with self._get_connection() as conn:
@@ -224,32 +429,44 @@ class Database:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT OR REPLACE INTO banned_users (user_id, name)
+                INSERT INTO banned_users (user_id, name)
                 VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET name = excluded.name
             """, (user_id, name))
+        self._banned_ids.add(user_id)
+        self.ban_cache.invalidate()
     
     def unban_user(self, user_id: int):
         """Unban a user"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM banned_users WHERE user_id = ?", (user_id,))
+        self._banned_ids.discard(user_id)
+        self.ban_cache.invalidate()
     
     def is_user_banned(self, user_id: int) -> bool:
-        """Check if user is banned"""
+        """Check if user is banned (in-memory, no query)"""
+        return user_id in self._banned_ids
+    
+    def _load_ids(self, table: str) -> Set[int]:
+        """Read user IDs from banned_users or admins"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                "SELECT 1 FROM banned_users WHERE user_id = ?",
-                (user_id,)
-            )
-            return cursor.fetchone() is not None
+            cursor.execute(f"SELECT user_id FROM {table}")
+            return {row[0] for row in cursor.fetchall()}
     
     def get_banned_users(self) -> List[Dict[str, Any]]:
-        """Get list of banned users"""
+        """Get list of banned users (cached, do not mutate the result)"""
+        cached = self.ban_cache.get('banned')
+        if cached is not None:
+            return cached
+        version = self.ban_cache.version
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM banned_users")
-            return [dict(row) for row in cursor.fetchall()]
+            banned = [dict(row) for row in cursor.fetchall()]
+        self.ban_cache.set('banned', banned, version)
+        return banned
     
     # ============ ADMIN OPERATIONS ============
     
@@ -258,29 +475,26 @@ class Database:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT OR REPLACE INTO admins (user_id, name)
+                INSERT INTO admins (user_id, name)
                 VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET name = excluded.name
             """, (user_id, name))
+        self._admin_ids.add(user_id)
     
     def remove_admin(self, user_id: int):
         """Remove an admin"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
+        self._admin_ids.discard(user_id)
     
     def is_admin(self, user_id: int) -> bool:
-        """Check if user is admin"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-            return cursor.fetchone() is not None
+        """Check if user is admin (in-memory, no query)"""
+        return user_id in self._admin_ids
     
     def has_any_admin(self) -> bool:
-        """Check if there's at least one admin"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM admins LIMIT 1")
-            return cursor.fetchone() is not None
+        """Check if there's at least one admin (in-memory, no query)"""
+        return bool(self._admin_ids)
     
     def get_admins(self) -> List[Dict[str, Any]]:
         """Get list of admins"""
@@ -292,39 +506,39 @@ class Database:
     # ============ STATISTICS ============
     
     def get_stats(self) -> Dict[str, Any]:
-        """Get statistics"""
+        """Get statistics (cached, do not mutate the result)"""
+        cached = self.gift_cache.get('stats')
+        if cached is not None:
+            return cached
+        version = self.gift_cache.version
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
-            # Gift counts by status
+            # Gift counts by status plus buyer aggregates in one statement
             cursor.execute("""
                 SELECT 
                     COUNT(*) as total,
-                    SUM(CASE WHEN status = 'available' THEN 1 ELSE 0 END) as available,
-                    SUM(CASE WHEN status = 'claimed' THEN 1 ELSE 0 END) as claimed,
-                    SUM(CASE WHEN status = 'bought' THEN 1 ELSE 0 END) as bought,
-                    SUM(CASE WHEN status = 'already_has' THEN 1 ELSE 0 END) as already_has
+                    SUM(status = 'available') as available,
+                    SUM(status = 'claimed') as claimed,
+                    SUM(status = 'bought') as bought,
+                    SUM(status = 'already_has') as already_has,
+                    (SELECT COUNT(DISTINCT user_id) FROM buyers) as participants,
+                    (SELECT COALESCE(SUM(amount), 0) FROM buyers) as total_amount
                 FROM gifts
             """)
             row = cursor.fetchone()
             
-            # Unique participants
-            cursor.execute("SELECT COUNT(DISTINCT user_id) FROM buyers")
-            participants = cursor.fetchone()[0]
-            
-            # Total amount pledged
-            cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM buyers")
-            total_amount = cursor.fetchone()[0]
-            
-            return {
+            stats = {
                 'total': row['total'] or 0,
                 'available': row['available'] or 0,
                 'claimed': row['claimed'] or 0,
                 'bought': row['bought'] or 0,
                 'already_has': row['already_has'] or 0,
-                'participants': participants or 0,
-                'total_amount': total_amount or 0
+                'participants': row['participants'] or 0,
+                'total_amount': row['total_amount'] or 0
             }
+        self.gift_cache.set('stats', stats, version)
+        return stats
     
     # ============ USER TRACKING ============
     
@@ -353,6 +567,41 @@ class Database:
             """)
             return [dict(row) for row in cursor.fetchall()]
     
+    def get_users_page(self, limit: int, after_last_seen: str = None,
+                       after_id: int = None) -> List[Dict[str, Any]]:
+        """Get up to `limit` users in get_all_users order, starting after
+        the (last_seen, user_id) keyset cursor of the previous page's last row"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT u.* FROM users u
+                WHERE NOT EXISTS (SELECT 1 FROM banned_users b WHERE b.user_id = u.user_id)
+                AND NOT EXISTS (SELECT 1 FROM admins a WHERE a.user_id = u.user_id)
+                AND (:after_id IS NULL OR (u.last_seen, u.user_id) < (:after_seen, :after_id))
+                ORDER BY u.last_seen DESC, u.user_id DESC
+                LIMIT :limit
+            """, {"after_seen": after_last_seen, "after_id": after_id, "limit": limit})
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_broadcast_recipients(self) -> List[int]:
+        """Get IDs of users who receive broadcasts (same set as get_all_users)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT u.user_id FROM users u
+                WHERE NOT EXISTS (SELECT 1 FROM banned_users b WHERE b.user_id = u.user_id)
+                AND NOT EXISTS (SELECT 1 FROM admins a WHERE a.user_id = u.user_id)
+            """)
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get a tracked user by ID"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """Find user by username"""
         with self._get_connection() as conn: